@@ -0,0 +1,165 @@
+import sys, os, os.path, string
+import re
+import time
+import subprocess
+import logging
+
+
+# NegotiatorLog lines begin with a timestamp, either "MM/DD/YY HH:MM:SS" or (older condor) "MM/DD HH:MM:SS"
+timestamp_re = re.compile(r'^(\d\d)/(\d\d)(?:/(\d\d))? (\d\d):(\d\d):(\d\d) (.*)$')
+phase_re = re.compile(r'^Phase (\d+(?:\.\d+)?):')
+pubads_re = re.compile(r'^Public ads include (\d+) submitter, (\d+) startd')
+negwith_re = re.compile(r'^\s*Negotiating with (\S+)')
+
+log = logging.getLogger('utcondor.neglog')
+
+cycle_start = "Started Negotiation Cycle"
+cycle_end = "Finished Negotiation Cycle"
+
+
+def fetch(host, fname):
+    # pull the NegotiatorLog from the CM, the same way we pull HISTORY
+    return subprocess.call(["/bin/sh", "-c", "/usr/sbin/condor_fetchlog %s NEGOTIATOR > %s"%(host, fname)])
+
+
+def parse_timestamp(m, year):
+    (mon, day, yy, hh, mm, ss) = [m.group(k) for k in xrange(1,7)]
+    if yy != None: year = 2000 + int(yy)
+    return time.mktime((year, int(mon), int(day), int(hh), int(mm), int(ss), 0, 0, -1))
+
+
+def new_cycle(t):
+    return {"start":t, "end":None, "duration":None, "phases":{}, "submitters":0, "submitter_ads":None, "startd_ads":None, "matches":0, "rejections":0}
+
+
+def cycles(f, since=None, year=None, extent=None):
+    # generator: streams lines from file object f and yields one record per completed negotiation cycle
+    # if a dict is given for extent, its "first" and "last" are set to the first and last log timestamps
+    # (on or after since) once the file has been consumed
+    if year is None: year = time.localtime().tm_year
+    cur = None
+    submitters = None
+    phase = None
+    phase_t = None
+    first_m = None
+    last_m = None
+    for line in f:
+        m = timestamp_re.match(line)
+        if m is None: continue
+        if extent != None:
+            # only the timestamps that end up in extent are worth parsing
+            if (first_m is None) and (since != None) and (parse_timestamp(m, year) < since): continue
+            if first_m is None: first_m = m
+            last_m = m
+        msg = m.group(7).strip()
+
+        if cycle_start in msg:
+            # an unfinished cycle (e.g. negotiator restart) is discarded
+            t = parse_timestamp(m, year)
+            if (since != None) and (t < since):
+                cur = None
+                continue
+            cur = new_cycle(t)
+            submitters = set()
+            phase = None
+            continue
+
+        if cur is None: continue
+        t = parse_timestamp(m, year)
+
+        pm = phase_re.match(msg)
+        if (pm != None) or (cycle_end in msg):
+            if phase != None: cur["phases"][phase] = cur["phases"].get(phase, 0.0) + (t - phase_t)
+            if pm != None:
+                phase = pm.group(1)
+                phase_t = t
+                continue
+            cur["end"] = t
+            cur["duration"] = t - cur["start"]
+            cur["submitters"] = len(submitters)
+            yield cur
+            cur = None
+            continue
+
+        if msg.startswith("Matched "):
+            cur["matches"] += 1
+        elif msg.startswith("Rejected "):
+            cur["rejections"] += 1
+        else:
+            nm = negwith_re.match(msg)
+            if nm != None:
+                submitters.add(nm.group(1))
+                continue
+            am = pubads_re.match(msg)
+            if am != None:
+                cur["submitter_ads"] = int(am.group(1))
+                cur["startd_ads"] = int(am.group(2))
+
+    if (extent != None) and (first_m != None):
+        extent["first"] = parse_timestamp(first_m, year)
+        extent["last"] = parse_timestamp(last_m, year)
+
+
+def summarize(cycle_list, start=None, end=None):
+    # start and end bound the run window the duty cycle is measured over; without them the window
+    # is just the span of the cycles themselves, which says nothing about idle time around them
+    s = {"cycles":len(cycle_list), "busy":0.0, "window":0.0, "duty":0.0, "mean_duration":0.0, "max_duration":0.0, "matches":0, "rejections":0, "phases":{}}
+    if len(cycle_list) <= 0: return s
+
+    for c in cycle_list:
+        s["busy"] += c["duration"]
+        s["max_duration"] = max(s["max_duration"], c["duration"])
+        s["matches"] += c["matches"]
+        s["rejections"] += c["rejections"]
+        for (p, dt) in c["phases"].items():
+            s["phases"][p] = s["phases"].get(p, 0.0) + dt
+
+    if start is None: start = cycle_list[0]["start"]
+    if end is None:   end = cycle_list[-1]["end"]
+    s["window"] = end - start
+    s["mean_duration"] = s["busy"] / float(len(cycle_list))
+    # fraction of wall-clock time the negotiator spent inside a cycle: near 1.0 means matchmaking is the bottleneck
+    if s["window"] > 0: s["duty"] = min(1.0, s["busy"] / s["window"])
+    return s
+
+
+def report(fname, since=None, until=None, dat_fname=None, duty_threshold=0.9):
+    # log a per-cycle table and an overall summary for the cycles in NegotiatorLog file fname
+    # duty is measured over since..until, defaulting to the first and last timestamps in the log
+    f = open(fname, 'r')
+    extent = {}
+    cycle_list = list(cycles(f, since=since, extent=extent))
+    f.close()
+
+    phase_names = set()
+    for c in cycle_list: phase_names |= set(c["phases"].keys())
+    phase_names = sorted(phase_names, key=lambda p: [int(x) for x in p.split('.')])
+
+    hdr = "#start\tduration\tsubmitters\tsubmitter_ads\tstartd_ads\tmatches\trejections"
+    hdr += "".join(["\tphase%s"%(p) for p in phase_names])
+    lines = [hdr]
+    for c in cycle_list:
+        ln = "%d\t%d\t%d\t%s\t%s\t%d\t%d" % (c["start"], c["duration"], c["submitters"], c["submitter_ads"], c["startd_ads"], c["matches"], c["rejections"])
+        ln += "".join(["\t%d"%(c["phases"].get(p, 0)) for p in phase_names])
+        lines += [ln]
+
+    if dat_fname != None:
+        df = open(dat_fname, 'w')
+        df.write("\n".join(lines) + "\n")
+        df.close()
+
+    log.info("negotiation cycles:\n%s", "\n".join(lines))
+
+    start = since if since != None else extent.get("first")
+    end = until if until != None else extent.get("last")
+    s = summarize(cycle_list, start=start, end=end)
+    if s["cycles"] <= 0:
+        log.warning("no completed negotiation cycles found in %s", fname)
+        return s
+
+    log.info("cycles= %d  mean-duration= %f  max-duration= %d  window= %d  duty= %f  matches= %d  rejections= %d", s["cycles"], s["mean_duration"], s["max_duration"], s["window"], s["duty"], s["matches"], s["rejections"])
+    log.info("phase totals= %s", "  ".join(["%s:%d"%(p, s["phases"][p]) for p in phase_names]))
+    # a single cycle, or no measurable window, can't distinguish a busy negotiator from an idle one
+    if (s["cycles"] >= 2) and (s["window"] > 0) and (s["duty"] >= duty_threshold):
+        log.warning("negotiator busy %d%% of the run -- throughput is likely negotiator-bound", int(100*s["duty"]))
+    return s
@@ -1,4 +1,4 @@
-import sys, os, os.path, string
+import sys, os, os.path, string, math
 import re
 import time
 import datetime
@@ -7,6 +7,9 @@ import subprocess
 import unittest
 import StringIO
 import argparse
+import logging, logging.handlers
+import threading
+import atexit
 
 from wallabyclient.exceptions import *
 from wallabyclient import WallabyHelpers, WallabyTypes
@@ -30,23 +33,222 @@ grp.add_argument('--preload-snapshot', dest='preload_snapshot', default=None, me
 grp.add_argument('--white', default=[], action='append', metavar='<regexp>', help='allow machine names matching <regexp>')
 grp.add_argument('--black', default=[], action='append', metavar='<regexp>', help='forbid machine names matching <regexp>') 
 
+grp = parser.add_argument_group(title="Logging")
+grp.add_argument('--log-level', dest='log_level', default='info', choices=['debug', 'info', 'warning', 'error'], help='default log level (def=info)')
+grp.add_argument('--log', dest='log_subsys', default=[], action='append', metavar='<subsys>=<level>', help='log level for one subsystem, e.g. nodes=debug (subsystems: store, nodes, poll, jobs, report, neglog, and each harness)')
+grp.add_argument('--log-file', dest='log_file', default=None, metavar='<file>', help='log to <file> instead of stdout')
+grp.add_argument('--log-buffer', dest='log_buffer', type=int, default=1000, metavar='<n>', help='buffer up to <n> log records between writes (def=1000, 0 to disable)')
+grp.add_argument('--log-flush-interval', dest='log_flush_interval', type=float, default=5.0, metavar='<sec>', help='write buffered log records at least this often (def=5)')
+
+grp = parser.add_argument_group(title="Snapshot Retention")
+grp.add_argument('--prune-snapshots', dest='prune_snapshots', action='store_true', default=False, help='prune old test snapshots at teardown')
+grp.add_argument('--keep-snapshots', dest='keep_snapshots', type=int, default=10, metavar='<n>', help='keep the newest <n> snapshots per test (def=10)')
+grp.add_argument('--snapshot-max-age', dest='snapshot_max_age', type=float, default=None, metavar='<days>', help='only prune snapshots older than <days>')
+grp.add_argument('--protect-snapshot', dest='protect_snapshot', default=[], action='append', metavar='<regexp>', help='never prune snapshots matching <regexp> (e.g. tagged baselines)')
+
 supported_api_versions = {20100804:0, 20100915:0, 20101031:1}
+
+# test snapshots embed the test date, as generated by condor_unit_test.setUp()
+testdate_format = "%Y/%m/%d_%H:%M:%S"
+testdate_re = re.compile(r'\d{4}/\d\d/\d\d_\d\d:\d\d:\d\d')
+
 connection = None
 params = None
 
 
+# all logging goes through the 'utcondor' logger hierarchy, one child logger per subsystem
+logging.getLogger('utcondor').addHandler(logging.NullHandler())
+
+def get_logger(subsys):
+    return logging.getLogger('utcondor.%s' % (subsys))
+
+store_log = get_logger('store')
+nodes_log = get_logger('nodes')
+poll_log = get_logger('poll')
+jobs_log = get_logger('jobs')
+report_log = get_logger('report')
+
+
+class buffered_log_handler(logging.handlers.MemoryHandler):
+    # Holds records until the buffer fills or a warning (or worse) arrives.  A daemon thread
+    # also writes out whatever is buffered every flush_interval seconds, so records logged
+    # just before a long sleep (e.g. in the pollers) still show up promptly.
+    def __init__(self, capacity, target, flush_interval=5.0):
+        logging.handlers.MemoryHandler.__init__(self, capacity, flushLevel=logging.WARNING, target=target)
+        self.flush_interval = flush_interval
+        self.closing = threading.Event()
+        self.flusher = threading.Thread(target=self.flush_loop, name='utcondor-log-flush')
+        self.flusher.daemon = True
+        self.flusher.start()
+        # logging.shutdown() closes handlers while holding their lock, which would stall the
+        # flusher; stop it first (atexit runs LIFO, so this precedes logging's own hook)
+        atexit.register(self.close)
+
+    def flush_loop(self):
+        while not self.closing.is_set():
+            self.closing.wait(self.flush_interval)
+            if self.closing.is_set(): break
+            self.flush()
+
+    def flush(self):
+        # MemoryHandler.flush takes the handler lock, so this is safe against concurrent emit()
+        logging.handlers.MemoryHandler.flush(self)
+        if self.target is not None: self.target.flush()
+
+    def close(self):
+        # stop the flusher before interpreter shutdown tears down the threading module
+        self.closing.set()
+        if self.flusher.is_alive() and (self.flusher is not threading.current_thread()): self.flusher.join(self.flush_interval + 1.0)
+        logging.handlers.MemoryHandler.close(self)
+
+
+class below_level_filter(logging.Filter):
+    # passes only records below the given level
+    def __init__(self, level):
+        logging.Filter.__init__(self)
+        self.level = level
+
+    def filter(self, record):
+        return record.levelno < self.level
+
+
+class rate_limited(object):
+    # emits at most one message per interval seconds; pass force=True for messages that must appear
+    def __init__(self, logger, interval, level=logging.INFO):
+        self.logger = logger
+        self.interval = interval
+        self.level = level
+        self.last = None
+
+    def __call__(self, msg, *args, **kw):
+        t = time.time()
+        if (not kw.get('force', False)) and (self.last != None) and ((t - self.last) < self.interval): return
+        self.last = t
+        self.logger.log(self.level, msg, *args)
+
+
+def init_logging(p):
+    root = logging.getLogger('utcondor')
+    root.setLevel(getattr(logging, p.log_level.upper()))
+    for spec in p.log_subsys:
+        (subsys, sep, level) = spec.partition('=')
+        if sep == '': raise Exception("expected <subsys>=<level>, got '%s'" % (spec))
+        get_logger(subsys).setLevel(getattr(logging, level.upper()))
+
+    fmt = logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s", "%Y/%m/%d %H:%M:%S")
+    if p.log_file != None:
+        h = logging.FileHandler(p.log_file)
+    else:
+        h = logging.StreamHandler(sys.stdout)
+        # warnings and errors go to the stderr handler below, don't repeat them on stdout
+        h.addFilter(below_level_filter(logging.WARNING))
+    h.setFormatter(fmt)
+    if p.log_buffer > 0: h = buffered_log_handler(p.log_buffer, h, flush_interval=p.log_flush_interval)
+    root.addHandler(h)
+
+    # failures are always written to stderr immediately, regardless of buffering
+    eh = logging.StreamHandler(sys.stderr)
+    eh.setLevel(logging.WARNING)
+    eh.setFormatter(fmt)
+    root.addHandler(eh)
+
+
+def flush_log():
+    for h in logging.getLogger('utcondor').handlers: h.flush()
+
+
 def reverse(L):
     r = L[:]
     r.reverse()
     return r
 
 
+def generate_accounting_groups(n_groups, depth=1, prefix='g', total_quota=None, accept_surplus=True):
+    # generates n_groups leaf accounting groups, arranged in a tree of the given depth (depth=1 is flat)
+    # returns (group_tuple_list, leaf_names), where group_tuple_list is suitable for build_accounting_group_feature
+    # If total_quota is given, quotas are static and split evenly over the leaves; otherwise dynamic quotas
+    # divide each parent evenly among its children.
+    if depth < 1: raise Exception("accounting group depth must be >= 1")
+    fanout = int(math.ceil(n_groups ** (1.0/depth)))
+    while (fanout ** depth) < n_groups: fanout += 1
+    width = len("%d"%(max(fanout-1, 0)))
+
+    # walk leaf indexes, registering each interior node the first time we pass through it
+    names = []
+    children = {}
+    leaves = []
+    for k in xrange(n_groups):
+        digits = []
+        r = k
+        for d in xrange(depth):
+            digits += [r % fanout]
+            r /= fanout
+        digits.reverse()
+        path = ""
+        for d in digits:
+            parent = path
+            if path != "": path += "."
+            path += "%s%0*d"%(prefix, width, d)
+            if not children.has_key(path):
+                children[path] = 0
+                children[parent] = children.get(parent, 0) + 1
+                names += [path]
+        leaves += [path]
+
+    if total_quota != None:
+        static = {}
+        q = int(total_quota) / n_groups
+        for leaf in leaves:
+            p = leaf
+            while p != "":
+                static[p] = static.get(p, 0) + q
+                p = p.rpartition('.')[0]
+
+    group_tuple_list = []
+    for name in names:
+        if total_quota != None:
+            group_tuple_list += [(name, True, static[name], accept_surplus)]
+        else:
+            group_tuple_list += [(name, False, 1.0/float(children[name.rpartition('.')[0]]), accept_surplus)]
+
+    return (group_tuple_list, leaves)
+
+
+def expected_group_shares(group_tuple_list, active=None):
+    # returns {group: expected fraction of the pool}, following the quota path from the top level down:
+    # at each level a group gets its quota (static or dynamic) as a fraction of its siblings' quotas.
+    # If active (a collection of groups with demand) is given, only groups with an active group at or
+    # below them take part, as if idle groups' quota were handed to their siblings as surplus.
+    quota = {}
+    for (name, is_static, q, accept_surplus) in group_tuple_list: quota[name] = float(q)
+
+    live = set()
+    for name in (quota.keys() if active is None else active):
+        p = name
+        while (p != "") and (p not in live):
+            live.add(p)
+            p = p.rpartition('.')[0]
+
+    total = {}
+    for name in live:
+        parent = name.rpartition('.')[0]
+        total[parent] = total.get(parent, 0.0) + quota.get(name, 0.0)
+
+    shares = {}
+    for name in sorted(live, key=lambda x: x.count('.')):
+        parent = name.rpartition('.')[0]
+        f = quota.get(name, 0.0) / total[parent] if total[parent] > 0 else 0.0
+        shares[name] = f * shares.get(parent, 1.0)
+    return shares
+
+
 def init(p):
     global params
     # At the moment I don't feel sure what the semantics would be for allowing multiple init calls
     if params is not None: raise Exception("params already initialized")
     params = p
     if params.collector_addr is None: params.collector_addr = params.broker_addr
+    init_logging(params)
 
 
 def connect_to_wallaby(broker_addr='127.0.0.1', port=5672, username='', passwd='', mechanisms='ANONYMOUS PLAIN GSSAPI'):
@@ -62,20 +264,20 @@ def connect_to_wallaby(broker_addr='127.0.0.1', port=5672, username='', passwd='
     else:
         broker_str = '%s:%d' % (broker_addr, port)
 
-    sys.stdout.write("Connecting to broker %s:\n" % (broker_str))
+    store_log.info("Connecting to broker %s:", broker_str)
 
     try:
         broker = session.addBroker('amqp://%s' % broker_str, mechanisms=mechanisms)
     except:
-        sys.stderr.write('Unable to connect to broker "%s"\n' % broker_str)
+        store_log.error('Unable to connect to broker "%s"', broker_str)
         raise
 
     # Retrieve the config store object
-    sys.stdout.write("Connecting to wallaby store:\n")
+    store_log.info("Connecting to wallaby store:")
     try:
         (store_agent, config_store) = WallabyHelpers.get_store_objs(session)
     except WallabyStoreError, error:
-        sys.stderr.write('Error: %s\n' % error.error_str)
+        store_log.error('Error: %s', error.error_str)
         session.delBroker(broker)
         raise
 
@@ -87,7 +289,7 @@ def connect_to_wallaby(broker_addr='127.0.0.1', port=5672, username='', passwd='
             store_api_version = error.major
         else:
             store_api_version = '%s.%s' % (error.major, error.minor)
-        sys.stderr.write('The store is using an API version that is not supported (%s)\n' % store_api_version)
+        store_log.error('The store is using an API version that is not supported (%s)', store_api_version)
         session.delBroker(broker)
         raise
 
@@ -97,21 +299,71 @@ def connect_to_wallaby(broker_addr='127.0.0.1', port=5672, username='', passwd='
 
 # A base class for our unit tests -- defines snapshot/restore for the pool
 class condor_unit_test(unittest.TestCase):
+    # subclasses (or standalone tools) that never restore can turn off the pre-test snapshot
+    pretest_snapshot = True
+
     def take_snapshot(self, name):
-        sys.stdout.write("Snapshotting current pool config to %s:\n" % (name))
+        store_log.info("Snapshotting current pool config to %s:", name)
         result = self.config_store.makeSnapshot(name)
         if result.status != 0:
-            sys.stderr.write("Failed to snapshot current pool to %s: (%d, %s)\n" % (name, result.status, result.text))
+            store_log.error("Failed to snapshot current pool to %s: (%d, %s)", name, result.status, result.text)
             raise WallabyStoreError(result.text)
-        sys.stdout.write("Finished config snapshot %s\n" % (name))
+        store_log.info("Finished config snapshot %s", name)
 
     def load_snapshot(self, name):
-        sys.stdout.write("Restoring pool config from %s:\n" % (name))
+        store_log.info("Restoring pool config from %s:", name)
         result = self.config_store.loadSnapshot(name)
         if result.status != 0:
-            sys.stderr.write("Failed to restore from %s: (%d, %s)\n" % (name, result.status, result.text))
+            store_log.error("Failed to restore from %s: (%d, %s)", name, result.status, result.text)
+            raise WallabyStoreError(result.text)
+        store_log.info("Finished restoring snapshot %s", name)
+
+    def remove_snapshot(self, name):
+        result = self.config_store.removeSnapshot(name)
+        if result.status != 0:
+            store_log.error("Failed to remove snapshot %s: (%d, %s)", name, result.status, result.text)
             raise WallabyStoreError(result.text)
-        sys.stdout.write("Finished restoring snapshot %s\n" % (name))
+
+    def list_snapshots(self, prefix=None):
+        snap_list = self.store_agent.getObjects(_class='Snapshot', _package=self.params.package)
+        names = [x.name for x in snap_list]
+        if prefix != None: names = [x for x in names if x.startswith(prefix)]
+        names.sort()
+        return names
+
+    def prune_snapshots(self, prefix=None, keep_last=None, max_age=None, protect=[], dry_run=False):
+        # Only snapshots with an embedded test date are candidates: anything else was made by hand.
+        # Snapshots are grouped per test (name with its date masked out); the newest keep_last of
+        # each test are kept, and of the rest only those older than max_age (days) are removed.
+        # Snapshots matching any regexp in protect are never removed.  This test's own pre-test snapshot
+        # and any preloaded snapshot are never removed either, but still count toward keep_last.
+        now = time.time()
+        protected = set([self.snapshot, self.params.preload_snapshot]) - set([None])
+        tests = {}
+        for name in self.list_snapshots(prefix=prefix):
+            m = testdate_re.search(name)
+            if m is None: continue
+            if True in [re.search(k, name) != None for k in protect]: continue
+            t = time.mktime(time.strptime(m.group(0), testdate_format))
+            key = name[:m.start()] + "*" + name[m.end():]
+            tests.setdefault(key, []).append((t, name))
+
+        pruned = []
+        for key in sorted(tests.keys()):
+            snaps = sorted(tests[key], reverse=True)
+            if keep_last != None: snaps = snaps[keep_last:]
+            elif max_age == None: continue
+            for (t, name) in snaps:
+                if name in protected: continue
+                if (max_age != None) and ((now - t) <= (max_age * 86400)): continue
+                pruned += [name]
+
+        store_log.info("%s %d snapshots:", "Would prune" if dry_run else "Pruning", len(pruned))
+        for name in pruned:
+            # a nightly prune can remove thousands: only list them all on request
+            store_log.log(logging.INFO if dry_run else logging.DEBUG, "    %s", name)
+            if not dry_run: self.remove_snapshot(name)
+        return pruned
 
 
     def setUp(self):
@@ -131,28 +383,30 @@ class condor_unit_test(unittest.TestCase):
         (self.session, self.broker, self.store_agent, self.config_store) = connection
 
         # take a snapshot before we load any requested pre-config
-        self.testdate = time.strftime("%Y/%m/%d_%H:%M:%S")
-        self.snapshot = "utcondor_%s_pretest" % (self.testdate)
-        self.take_snapshot(self.snapshot)
+        self.testdate = time.strftime(testdate_format)
+        self.snapshot = None
+        if self.pretest_snapshot:
+            self.snapshot = "utcondor_%s_pretest" % (self.testdate)
+            self.take_snapshot(self.snapshot)
 
         # load pre-config snapshot after we snapshot current state
         if self.params.preload_snapshot != None:
             self.load_snapshot(self.params.preload_snapshot)
 
         try:
-            sys.stdout.write("Obtaining nodes from config store:\n")
+            store_log.info("Obtaining nodes from config store:")
             node_list = self.store_agent.getObjects(_class='Node', _package=self.params.package)
 
-            sys.stdout.write("Obtaining groups from config store:\n")
+            store_log.info("Obtaining groups from config store:")
             group_list = self.store_agent.getObjects(_class='Group', _package=self.params.package)
 
-            sys.stdout.write("Obtaining features from config store:\n")
+            store_log.info("Obtaining features from config store:")
             feat_list = self.store_agent.getObjects(_class='Feature', _package=self.params.package)
 
-            sys.stdout.write("Obtaining params from config store:\n")
+            store_log.info("Obtaining params from config store:")
             param_list = self.store_agent.getObjects(_class='Parameter', _package=self.params.package)
         except:
-            sys.stderr.write("Failed to obtain data from current config store\n")
+            store_log.error("Failed to obtain data from current config store")
             raise
 
         self.node_names = [x.name for x in node_list]
@@ -162,35 +416,56 @@ class condor_unit_test(unittest.TestCase):
 
 
     def tearDown(self):
-        if self.params.no_restore:
-            sys.stdout.write("WARNING: NOT restoring pre-test snapshot %s\n" % (self.snapshot))
+        # make sure everything the test logged is written before restore/teardown output
+        flush_log()
+
+        if self.snapshot is None:
+            pass
+        elif self.params.no_restore:
+            store_log.warning("NOT restoring pre-test snapshot %s", self.snapshot)
         else:
             self.load_snapshot(self.snapshot)
 
             # Activate restored config
             result = self.config_store.activateConfiguration()
             if result.status != 0:
-                sys.stderr.write("Failed to activate restored configuration %s: (%s, %s)\n" % (self.snapshot, result.status, result.text))
+                store_log.error("Failed to activate restored configuration %s: (%s, %s)", self.snapshot, result.status, result.text)
                 raise Exception(result.text)
 
+        if self.params.prune_snapshots:
+            self.prune_snapshots(keep_last=self.params.keep_snapshots, max_age=self.params.snapshot_max_age, protect=self.params.protect_snapshot)
+
         self.session.delBroker(self.broker)
 
 
     def assert_param(self, param_name):
         if not param_name in self.param_names:
-            sys.stdout.write("Adding parameter %s to store:\n" % (param_name))
+            store_log.info("Adding parameter %s to store:", param_name)
             result = self.config_store.addParam(param_name)
             if result.status != 0:
-                sys.stderr.write("Failed to add param %s: (%d, %s)\n" % (param_name, result.status, result.text))
+                store_log.error("Failed to add param %s: (%d, %s)", param_name, result.status, result.text)
                 raise WallabyStoreError("Failed to add param")
             self.param_names += [param_name]
 
 
+    def assert_params(self, param_names):
+        # bulk version of assert_param: one set difference up front, then only add what's missing
+        missing = list(set(param_names) - set(self.param_names))
+        missing.sort()
+        for param_name in missing:
+            result = self.config_store.addParam(param_name)
+            if result.status != 0:
+                store_log.error("Failed to add param %s: (%d, %s)", param_name, result.status, result.text)
+                raise WallabyStoreError("Failed to add param")
+        if len(missing) > 0: store_log.info("Added %d parameters to store", len(missing))
+        self.param_names += missing
+
+
     def assert_feature(self, feature_name):
         if not feature_name in self.feat_names:
             result = self.config_store.addFeature(feature_name)
             if result.status != 0:
-                sys.stderr.write("Failed to add feature %s: (%s, %s)\n" % (feature_name, result.status, result.text))
+                store_log.error("Failed to add feature %s: (%s, %s)", feature_name, result.status, result.text)
                 raise WallabyStoreError(result.text)
             self.feat_names += [feature_name]
 
@@ -199,10 +474,10 @@ class condor_unit_test(unittest.TestCase):
         # ensure these actually exist
         for grp in group_names:
             if not grp in self.group_names:
-                sys.stdout.write("Adding group %s to store:\n" % (grp))
+                store_log.info("Adding group %s to store:", grp)
                 result = self.config_store.addExplicitGroup(grp)
                 if result.status != 0:
-                    sys.stderr.write("Failed to create group %s: (%d, %s)\n" % (grp, result.status, result.text))
+                    store_log.error("Failed to create group %s: (%d, %s)", grp, result.status, result.text)
                     raise WallabyStoreError(result.text)
 
         # In principle, could automatically install features if they aren't found
@@ -214,7 +489,7 @@ class condor_unit_test(unittest.TestCase):
             group_obj = WallabyHelpers.get_group(self.session, self.config_store, name)
             result = group_obj.modifyFeatures(mod_op, feature_names, {})
             if result.status != 0:
-                sys.stderr.write("Failed to set features for %s: (%d, %s)\n" % (name, result.status, result.text))
+                store_log.error("Failed to set features for %s: (%d, %s)", name, result.status, result.text)
                 raise WallabyStoreError(result.text)
 
 
@@ -234,7 +509,7 @@ class condor_unit_test(unittest.TestCase):
             else:
                 result = group_obj.modifyFeatures(mod_op, feature_names, {})
             if result.status != 0:
-                sys.stderr.write("Failed to set features for %s: (%d, %s)\n" % (name, result.status, result.text))
+                store_log.error("Failed to set features for %s: (%d, %s)", name, result.status, result.text)
                 raise WallabyStoreError(result.text)
 
 
@@ -244,7 +519,7 @@ class condor_unit_test(unittest.TestCase):
             node_obj = WallabyHelpers.get_node(self.session, self.config_store, name)
             result = node_obj.modifyMemberships(mod_op, group_names, {})
             if result.status != 0:
-                sys.stderr.write("Failed to set groups for %s: (%d, %s)\n" % (name, result.status, result.text))
+                store_log.error("Failed to set groups for %s: (%d, %s)", name, result.status, result.text)
                 raise WallabyStoreError(result.text)
 
 
@@ -253,19 +528,19 @@ class condor_unit_test(unittest.TestCase):
             node_obj = WallabyHelpers.get_node(self.session, self.config_store, name)
             result = node_obj.modifyMemberships('replace', [], {})
             if result.status != 0:
-                sys.stderr.write("Failed to clear groups from %s: (%d, %s)\n" % (name, result.status, result.text))
+                store_log.error("Failed to clear groups from %s: (%d, %s)", name, result.status, result.text)
                 raise WallabyStoreError("Failed to clear groups")
 
             group_name = WallabyHelpers.get_id_group_name(node_obj, self.session)
             group_obj = WallabyHelpers.get_group(self.session, self.config_store, group_name)
             result = group_obj.modifyFeatures('replace', [], {})
             if result.status != 0:
-                sys.stderr.write("Failed to clear features from %s: (%d, %s)\n" % (name, result.status, result.text))
+                store_log.error("Failed to clear features from %s: (%d, %s)", name, result.status, result.text)
                 raise WallabyStoreError("Failed to clear features")
 
             result = group_obj.modifyParams('replace', {}, {})
             if result.status != 0:
-                sys.stderr.write("Failed to clear params from %s: (%d, %s)\n" % (name, result.status, result.text))
+                store_log.error("Failed to clear params from %s: (%d, %s)", name, result.status, result.text)
                 raise WallabyStoreError("Failed to clear params")
 
 
@@ -273,12 +548,12 @@ class condor_unit_test(unittest.TestCase):
             group_obj = WallabyHelpers.get_group(self.session, self.config_store, '+++DEFAULT')
             result = group_obj.modifyFeatures('replace', [], {})
             if result.status != 0:
-                sys.stderr.write("Failed to clear features from %s: (%d, %s)\n" % (name, result.status, result.text))
+                store_log.error("Failed to clear features from %s: (%d, %s)", name, result.status, result.text)
                 raise WallabyStoreError("Failed to clear features")
 
             result = group_obj.modifyParams('replace', {}, {})
             if result.status != 0:
-                sys.stderr.write("Failed to clear params from %s: (%d, %s)\n" % (name, result.status, result.text))
+                store_log.error("Failed to clear params from %s: (%d, %s)", name, result.status, result.text)
                 raise WallabyStoreError("Failed to clear params")
         
 
@@ -290,54 +565,49 @@ class condor_unit_test(unittest.TestCase):
         param_obj = WallabyHelpers.get_param(self.session, self.config_store, param_name)
         result = param_obj.setRequiresRestart(True)
         if result.status != 0:
-            sys.stderr.write("Failed to set restart for %s: (%d, %s)\n" % (param_name, result.status, result.text))
+            store_log.error("Failed to set restart for %s: (%d, %s)", param_name, result.status, result.text)
             raise WallabyStoreError("Failed to set restart")
 
         # set this param to a new value, to ensure a restart on activation
         feat_obj = WallabyHelpers.get_feature(self.session, self.config_store, feature_name)
         result = feat_obj.modifyParams('add', {param_name:("%s"%(time.time()))}, {})
         if result.status != 0:
-            sys.stderr.write("Failed to add param %s to %s: (%d, %s)\n" % (param_name, feature_name, result.status, result.text))
+            store_log.error("Failed to add param %s to %s: (%d, %s)", param_name, feature_name, result.status, result.text)
             raise WallabyStoreError("Failed to add param")
 
         # make sure master is tagged for restart via this parameter
         subsys_obj = WallabyHelpers.get_subsys(self.session, self.config_store, 'master')
         result = subsys_obj.modifyParams('add', [param_name], {})
         if result.status != 0:
-            sys.stderr.write("Failed to add param %s to master: (%d, %s)\n" % (param_name, result.status, result.text))
+            store_log.error("Failed to add param %s to master: (%d, %s)", param_name, result.status, result.text)
             raise WallabyStoreError("Failed to add param")
 
 
     def poll_for_process_completion(self, procs, interval=1, progress_interval=10):
+        progress = rate_limited(poll_log, progress_interval)
+        flush_log()
         t0 = time.time()
-        t = 0
-        tt = 0
         while True:
             time.sleep(interval)
-            t += interval
-            tt += interval
-            if (t >= progress_interval):
-                t -= progress_interval
-                sys.stdout.write("..%04d"%(tt))
-                sys.stdout.flush()
-            completed = True
-            for p in procs:
-                if p.poll() == None: completed = False
-            if completed: break
-        sys.stdout.write("\n")
-        return time.time() - t0
-
-
-    def poll_for_slots(self, nslots, group=None, interval=30, maxtime=600, required=None, expected_nodes=None):
+            running = len([p for p in procs if p.poll() == None])
+            if running <= 0: break
+            progress("elapsed= %d sec  running= %d/%d processes", int(time.time() - t0), running, len(procs))
+        elapsed = time.time() - t0
+        poll_log.info("elapsed= %d sec  all %d processes completed", int(elapsed), len(procs))
+        return elapsed
+
+
+    def poll_for_slots(self, nslots, group=None, interval=30, maxtime=600, required=None, expected_nodes=None, progress_interval=60):
         if group == None:
             status_cmd = "condor_status -subsystem startd -format \"%s\\n\" Name | wc -l"
         else:
             status_cmd = "condor_status -subsystem startd -format \"%%s\\n\" Name -constraint 'stringListMember(\"%s\", WallabyGroups)' | wc -l" % (group)
+        if group == None: poll_log.info("Waiting for %d slots to spool up:", nslots)
+        else:             poll_log.info("Waiting for %d slots from group %s to spool up:", nslots, group)
+        progress = rate_limited(poll_log, progress_interval)
         t0 = time.time()
         while (True):
-            sys.stdout.write("Waiting %d seconds for %d slots " % (interval, nslots))
-            if group != None: sys.stdout.write("from group %s " % (group))
-            sys.stdout.write("to spool up:\n")
+            flush_log()
             time.sleep(interval)
             try:
                 res = subprocess.Popen(["/bin/sh", "-c", status_cmd], stdout=subprocess.PIPE, stderr=self.devnull).communicate()[0]
@@ -346,15 +616,15 @@ class condor_unit_test(unittest.TestCase):
             except:
                 n = 0
             elapsed = time.time() - t0
+            progress("elapsed= %d sec  slots= %d", int(elapsed), n, force=((n >= nslots) or (elapsed > maxtime)))
             # stop waiting if we see we have the desired number of configured startds
-            sys.stdout.write("elapsed= %d sec  slots= %d:\n" % (int(elapsed), n))
             if n >= nslots: break
             if (elapsed > maxtime):
                 if expected_nodes != None:
                     xs = set(expected_nodes)
                     rs = set(self.reporting_nodes(with_groups=group))
                     missing = list(xs - rs)
-                    sys.stdout.write("missing nodes: %s\n" % (missing))
+                    poll_log.warning("missing nodes: %s", missing)
                 if (required != None) and (n >= required): break
                 raise Exception("Exceeded max polling time")
 
@@ -395,7 +665,7 @@ class condor_unit_test(unittest.TestCase):
                 res = subprocess.Popen(["/bin/sh", "-c", q_cmd], stdout=subprocess.PIPE, stderr=self.devnull).communicate()[0]
                 t = int(res)
             except:
-                sys.stderr.write("job_count: exception on command:\n%s\n"%(q_cmd))
+                jobs_log.error("job_count: exception on command: %s", q_cmd)
                 if raise_on_err: raise
                 t = 0
             n += t
@@ -403,20 +673,21 @@ class condor_unit_test(unittest.TestCase):
         return n
 
 
-    def poll_for_empty_job_queue(self, cluster=None, tag=None, tagvar="CondorUnitTestTag", interval=30, maxtime=600, schedd=[]):
+    def poll_for_empty_job_queue(self, cluster=None, tag=None, tagvar="CondorUnitTestTag", interval=30, maxtime=600, schedd=[], progress_interval=60):
         try:
             # get an initial job count.
             n0 = self.job_count(cluster=cluster, tag=tag, tagvar=tagvar, schedd=schedd, raise_on_err=True)
         except:
             n0 = 999999
+        if cluster != None: poll_log.info("Waiting for job que to clear for cluster %d:", cluster)
+        elif tag != None:   poll_log.info("Waiting for job que to clear for %s==\"%s\":", tagvar, tag)
+        else:               poll_log.info("Waiting for job que to clear:")
+        progress = rate_limited(poll_log, progress_interval)
         t0 = time.time()
         tL = t0
         nL = n0
         while (True):
-            sys.stdout.write("Waiting %s seconds for job que to clear " % (interval))
-            if cluster != None: sys.stdout.write("for cluster %d " % (cluster))
-            elif tag != None: sys.stdout.write("for %s==\"%s\"" % (tagvar, tag))
-            sys.stdout.write("\n")
+            flush_log()
             time.sleep(interval)
             try:
                 n = self.job_count(cluster=cluster, tag=tag, tagvar=tagvar, schedd=schedd, raise_on_err=True)
@@ -427,7 +698,7 @@ class condor_unit_test(unittest.TestCase):
             elapsedI = tC - tL
             rate = float(n0-n)/float(elapsed)
             rateI = float(nL-n)/float(elapsedI)
-            sys.stdout.write("elapsed= %d sec   interval= %d sec   jobs= %d   rate= %f  cum-rate= %f:\n" % (int(elapsed), int(elapsedI), n, rateI, rate))
+            progress("elapsed= %d sec   interval= %d sec   jobs= %d   rate= %f  cum-rate= %f", int(elapsed), int(elapsedI), n, rateI, rate, force=((n <= 0) or (elapsed > maxtime)))
             # stop waiting when que is clear of specified jobs
             if n <= 0: break
             if (elapsed > maxtime): raise Exception("Exceeded max polling time")
@@ -435,6 +706,55 @@ class condor_unit_test(unittest.TestCase):
             tL = tC
 
 
+    def report_command(self, title, cmd):
+        # run a reporting command (e.g. plot_pool_thruput) and route its output through the log
+        proc = subprocess.Popen(["/bin/sh", "-c", cmd], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        (res, err) = proc.communicate()
+        report_log.info("%s:\n%s", title, res.rstrip('\n'))
+        if (proc.returncode != 0) or (err.strip() != ''):
+            report_log.warning("%s: command '%s' returned %d:\n%s", title, cmd, proc.returncode, err.rstrip('\n'))
+
+
+    def collector_stats(self, pool=None, attrs=['UpdatesTotal', 'UpdatesLost', 'UpdatesSequenced', 'LastHeardFrom']):
+        # returns {collector-address: {attr: value}} for each collector ad reporting to the pool
+        # collector names need not be unique, so ads are keyed on MyAddress; Name is included as a string
+        cmd = "condor_status -collector %s" % (" ".join(self.format_opt_list(['MyAddress', 'Name'] + attrs)))
+        if pool != None: cmd += " -pool '%s'" % (pool)
+        res = subprocess.Popen(["/bin/sh", "-c", cmd], stdout=subprocess.PIPE, stderr=self.devnull).communicate()[0]
+
+        stats = {}
+        for line in res.strip('\n').split('\n'):
+            data = line.split('\t')
+            if len(data) != (2 + len(attrs)): continue
+            s = {'Name':data[1]}
+            for (a, v) in zip(attrs, data[2:]):
+                try:
+                    s[a] = int(v)
+                except ValueError:
+                    s[a] = None
+            stats[data[0]] = s
+        return stats
+
+
+    def startd_ad_ages(self, pool=None, constraint=None):
+        # age, in seconds, of each startd ad currently held by the collector
+        cmd = "condor_status -subsystem startd -format \"%d\\n\" LastHeardFrom"
+        if constraint != None: cmd += " -constraint '%s'" % (constraint)
+        if pool != None: cmd += " -pool '%s'" % (pool)
+        res = subprocess.Popen(["/bin/sh", "-c", cmd], stdout=subprocess.PIPE, stderr=self.devnull).communicate()[0]
+
+        now = time.time()
+        ages = []
+        for line in res.split('\n'):
+            line = line.strip()
+            if line == "": continue
+            try:
+                ages += [now - int(line)]
+            except ValueError:
+                pass
+        return ages
+
+
     def format_opt_list(self, attr_list):
         n = len(attr_list)
         flist = []
@@ -475,7 +795,7 @@ class condor_unit_test(unittest.TestCase):
         for node in self.node_names:
             node_obj = WallabyHelpers.get_node(self.session, self.config_store, node)
 
-            sys.stdout.write("    list_nodes: node=%s   checkin= %s\n" % (node, node_obj.last_checkin))
+            nodes_log.debug("list_nodes: node=%s   checkin= %s", node, node_obj.last_checkin)
 
             if (checkin_since != None) and ((node_obj.last_checkin / 1000000) < checkin_since): continue
 
@@ -527,8 +847,7 @@ class condor_unit_test(unittest.TestCase):
 
 
     def build_feature(self, feature_name, params={}, mod_op='replace'):
-        sys.stdout.write("building feature %s\n"%(feature_name))
-        sys.stdout.flush()
+        store_log.info("building feature %s", feature_name)
 
         self.assert_feature(feature_name)
 
@@ -540,15 +859,14 @@ class condor_unit_test(unittest.TestCase):
         feat_obj = WallabyHelpers.get_feature(self.session, self.config_store, feature_name)
         result = feat_obj.modifyParams(mod_op, params, {})
         if result.status != 0:
-            sys.stderr.write("Failed to modify params for %s: (%d, %s)\n" % (feature_name, result.status, result.text))
+            store_log.error("Failed to modify params for %s: (%d, %s)", feature_name, result.status, result.text)
             raise WallabyStoreError("Failed to add feature")
 
 
     def build_access_feature(self, feature_name, collector_host=None, condor_host=None):
         if condor_host==None: condor_host = self.params.collector_addr
         if collector_host==None: collector_host = condor_host
-        sys.stdout.write("building access feature %s\n"%(feature_name))
-        sys.stdout.flush()
+        store_log.info("building access feature %s", feature_name)
 
         self.assert_feature(feature_name)
 
@@ -567,13 +885,12 @@ class condor_unit_test(unittest.TestCase):
         feat_obj = WallabyHelpers.get_feature(self.session, self.config_store, feature_name)
         result = feat_obj.modifyParams('replace', params, {})
         if result.status != 0:
-            sys.stderr.write("Failed to modify params for %s: (%d, %s)\n" % (feature_name, result.status, result.text))
+            store_log.error("Failed to modify params for %s: (%d, %s)", feature_name, result.status, result.text)
             raise WallabyStoreError("Failed to add feature")
 
 
-    def build_execute_feature(self, feature_name, n_startd=1, n_slots=1, n_dynamic=0, dl_append=True, dedicated=True, preemption=False, ad_machine=True):
-        sys.stdout.write("building execute feature %s -- n_startd=%d  n_slots=%d  n_dynamic=%d\n"%(feature_name, n_startd, n_slots, n_dynamic))
-        sys.stdout.flush()
+    def build_execute_feature(self, feature_name, n_startd=1, n_slots=1, n_dynamic=0, dl_append=True, dedicated=True, preemption=False, ad_machine=True, collector_hosts=None):
+        store_log.info("building execute feature %s -- n_startd=%d  n_slots=%d  n_dynamic=%d", feature_name, n_startd, n_slots, n_dynamic)
 
         self.assert_feature(feature_name)
 
@@ -620,6 +937,9 @@ class condor_unit_test(unittest.TestCase):
             if ad_machine:
                 params["STARTD%s.STARTD_ATTRS"%(tag)] = "$(STARTD_ATTRS), Machine"
                 params["STARTD%s.Machine"%(tag)] = "\"s%s.$(FULL_HOSTNAME)\""%(tag)
+            if collector_hosts:
+                # spread startds round-robin across the given (sub-)collectors
+                params["STARTD.%s.COLLECTOR_HOST"%(locname)] = collector_hosts[s % len(collector_hosts)]
 
         params["DAEMON_LIST"] = daemon_list
 
@@ -631,7 +951,7 @@ class condor_unit_test(unittest.TestCase):
         feat_obj = WallabyHelpers.get_feature(self.session, self.config_store, feature_name)
         result = feat_obj.modifyParams('replace', params, {})
         if result.status != 0:
-            sys.stderr.write("Failed to modify params for %s: (%d, %s)\n" % (feature_name, result.status, result.text))
+            store_log.error("Failed to modify params for %s: (%d, %s)", feature_name, result.status, result.text)
             raise WallabyStoreError("Failed to add feature")
 
         tslots = n_startd * n_slots
@@ -639,8 +959,7 @@ class condor_unit_test(unittest.TestCase):
 
 
     def build_scheduler_feature(self, feature_name, n_schedd=1, dl_append=True):
-        sys.stdout.write("building scheduler feature %s with %d schedds\n"%(feature_name, n_schedd))
-        sys.stdout.flush()
+        store_log.info("building scheduler feature %s with %d schedds", feature_name, n_schedd)
         
         self.assert_feature(feature_name)
 
@@ -674,7 +993,7 @@ class condor_unit_test(unittest.TestCase):
         feat_obj = WallabyHelpers.get_feature(self.session, self.config_store, feature_name)
         result = feat_obj.modifyParams('replace', params, {})
         if result.status != 0:
-            sys.stderr.write("Failed to modify params for %s: (%d, %s)\n" % (feature_name, result.status, result.text))
+            store_log.error("Failed to modify params for %s: (%d, %s)", feature_name, result.status, result.text)
             raise WallabyStoreError("Failed to add feature")
 
         return schedd_names
@@ -683,8 +1002,7 @@ class condor_unit_test(unittest.TestCase):
     def build_collector_feature(self, feature_name, n_coll=1, portstart=10000, dl_append=True, collector_host=None, condor_host=None, disable_plugins=True):
         if condor_host==None: condor_host = self.params.collector_addr
         if collector_host==None: collector_host = condor_host
-        sys.stdout.write("building collector feature %s with %d sub-collectors\n"%(feature_name, n_coll))
-        sys.stdout.flush()
+        store_log.info("building collector feature %s with %d sub-collectors", feature_name, n_coll)
         
         self.assert_feature(feature_name)
 
@@ -718,15 +1036,14 @@ class condor_unit_test(unittest.TestCase):
         feat_obj = WallabyHelpers.get_feature(self.session, self.config_store, feature_name)
         result = feat_obj.modifyParams('replace', params, {})
         if result.status != 0:
-            sys.stderr.write("Failed to modify params for %s: (%d, %s)\n" % (feature_name, result.status, result.text))
+            store_log.error("Failed to modify params for %s: (%d, %s)", feature_name, result.status, result.text)
             raise WallabyStoreError("Failed to add feature")
 
         return collector_names
 
 
     def build_accounting_group_feature(self, feature_name, group_tuple_list):
-        sys.stdout.write("building acct group feature %s\n"%(feature_name))
-        sys.stdout.flush()
+        store_log.info("building acct group feature %s with %d groups", feature_name, len(group_tuple_list))
         
         self.assert_feature(feature_name)
 
@@ -739,15 +1056,13 @@ class condor_unit_test(unittest.TestCase):
             else:         params["GROUP_QUOTA_DYNAMIC_%s"%(name)] = "%f"%(float(quota))
             if accept_surplus: params["GROUP_AUTOREGROUP_%s"%(name)] = "TRUE"
 
-        # make sure parameters are declared
-        splist = params.keys()
-        splist.sort()
-        for p in splist: self.assert_param(p)
+        # make sure parameters are declared -- with thousands of groups, do this in bulk
+        self.assert_params(params.keys())
 
         feat_obj = WallabyHelpers.get_feature(self.session, self.config_store, feature_name)
         result = feat_obj.modifyParams('replace', params, {})
         if result.status != 0:
-            sys.stderr.write("Failed to modify params for %s: (%d, %s)\n" % (feature_name, result.status, result.text))
+            store_log.error("Failed to modify params for %s: (%d, %s)", feature_name, result.status, result.text)
             raise WallabyStoreError("Failed to add feature")
 
 